@@ -2,7 +2,8 @@ import numpy as np
 import datetime
 
 import torch
-from torch.utils.data import TensorDataset, DataLoader, random_split
+from torch.utils.data import TensorDataset, DataLoader
+from torch.utils.data import BatchSampler, RandomSampler, SequentialSampler
 from torch.utils.tensorboard import SummaryWriter
 
 import matplotlib.pyplot as plt
@@ -20,20 +21,34 @@ class StepByStep(object):
         self.model = model
         self.loss_fn = loss_fn
         self.optimizer = optimizer
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # The device is kept as a torch.device, so it isn't parsed from
+        # a string again on every transfer
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         # Let's send the model to the specified device right away
         self.model.to(self.device)
+        # Scales the loss to prevent float16 gradients from underflowing
+        self.scaler = self._make_scaler()
+        # Side stream used to copy the next mini-batch to the GPU
+        self.copy_stream = self._make_copy_stream()
 
         # These attributes are defined here, but since they are
         # not informed at the moment of creation, we keep them None
         self.train_loader = None
         self.val_loader = None
+        self.batch_size = None
         self.writer = None
+        # Number of mini-batches whose gradients are accumulated
+        # before each parameter update
+        self.accumulation_steps = 1
+        # bfloat16 autocast on CPU is opt-in, as it costs precision
+        self.use_bf16 = False
         
         # These attributes are going to be computed internally
-        self.losses = []
-        self.val_losses = []
+        # Losses are kept as arrays, one entry per epoch
+        self.losses = np.empty(0, dtype=np.float32)
+        self.val_losses = np.empty(0, dtype=np.float32)
         self.total_epochs = 0
+        self.pending_steps = 0
 
         # Creates the train_step function for our model, 
         # loss function and optimizer
@@ -48,64 +63,172 @@ class StepByStep(object):
         # It sets the corresponding attribute (to be used later in
         # the mini-batches) and sends the model to the device
         try:
-            self.device = device
+            self.device = torch.device(device)
             self.model.to(self.device)
         except RuntimeError:
-            self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
             print(f"Couldn't send it to {device}, sending it to {self.device} instead.")
             self.model.to(self.device)
+        # The scaler and the copy stream only make sense for CUDA devices
+        self.scaler = self._make_scaler()
+        self.copy_stream = self._make_copy_stream()
 
-    def set_loaders(self, train_loader, val_loader=None):
+    def set_loaders(self, train_loader, val_loader=None, batch_size=256):
         # This method allows the user to define which train_loader (and val_loader, optionally) to use
         # Both loaders are then assigned to attributes of the class
         # So they can be referred to later
+        # A "loader" may also be a preloaded (x, y) tuple of tensors
+        # already on the device, in which case batch_size is used to
+        # slice it into mini-batches
         self.train_loader = train_loader
         self.val_loader = val_loader
+        self.batch_size = batch_size
+
+    def set_accumulation_steps(self, steps=1):
+        # This method allows the user to update parameters only every
+        # `steps` mini-batches, accumulating their gradients in between
+        # The effective batch size becomes steps * batch size
+        if steps < 1:
+            raise ValueError(f'steps must be at least 1, got {steps}')
+        self.accumulation_steps = steps
+
+    def set_bf16(self, enabled=True):
+        # This method allows the user to run the forward pass on CPU in
+        # bfloat16 - it is only faster on CPUs with AVX512-BF16 or AMX,
+        # and its 8-bit mantissa makes large targets noticeably coarser
+        self.use_bf16 = enabled
 
     def set_tensorboard(self, name, folder='runs', suffix=None):
         # This method allows the user to define a SummaryWriter to interface with TensorBoard
         self.writer = SummaryWriter(f'{folder}/{name}_{suffix}')
 
+    def _make_scaler(self):
+        # Mixed precision (and therefore loss scaling) is only used on CUDA
+        enabled = self.device.type == 'cuda'
+        return torch.amp.GradScaler('cuda', enabled=enabled)
+
+    def _make_copy_stream(self):
+        # Host to device copies can only overlap with compute on CUDA
+        if self.device.type == 'cuda':
+            return torch.cuda.Stream(device=self.device)
+        return None
+
+    def _autocast(self):
+        # Runs the forward pass in float16 on CUDA and, if enabled, in
+        # bfloat16 on CPU - bfloat16 has the same range as float32, so it
+        # needs no scaler. Everything else runs in float32
+        device_type = self.device.type
+        if device_type == 'cpu':
+            return torch.autocast(device_type='cpu', dtype=torch.bfloat16,
+                                  enabled=self.use_bf16)
+        return torch.autocast(device_type=device_type, dtype=torch.float16,
+                              enabled=(device_type == 'cuda'))
+
     def _make_train_step_fn(self):
         # This method does not need ARGS... it can refer to
         # the attributes: self.model, self.loss_fn and self.optimizer
         
         # Builds function that performs a step in the train loop
         def perform_train_step_fn(x, y):
-            # Sets model to TRAIN mode
-            self.model.train()
-
-            # Step 1 - Computes our model's predicted output - forward pass
-            yhat = self.model(x)
-            # Step 2 - Computes the loss
-            loss = self.loss_fn(yhat, y)
+            with self._autocast():
+                # Step 1 - Computes our model's predicted output - forward pass
+                yhat = self.model(x)
+                # Step 2 - Computes the loss
+                loss = self.loss_fn(yhat, y)
             # Step 3 - Computes gradients for both "a" and "b" parameters
-            loss.backward()
+            # (if the scaler is disabled, this is a regular backward pass)
+            # Each accumulated mini-batch contributes its share of the gradient
+            self.scaler.scale(loss / self.accumulation_steps).backward()
+            self.pending_steps += 1
             # Step 4 - Updates parameters using gradients and the learning rate
-            self.optimizer.step()
-            self.optimizer.zero_grad()
+            # once enough mini-batches have been accumulated
+            # (>= in case the number of steps was lowered midway)
+            if self.pending_steps >= self.accumulation_steps:
+                self._optimizer_step()
 
-            # Returns the loss
-            return loss.item()
+            # Returns the loss tensor - calling item() here would
+            # synchronize with the device at every mini-batch
+            return loss
 
         # Returns the function that will be called inside the train loop
         return perform_train_step_fn
     
+    def _optimizer_step(self):
+        # The scaler unscales the gradients first and skips the update
+        # if any of them is inf/NaN
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
+        # Discards the gradients instead of filling them with zeros
+        self.optimizer.zero_grad(set_to_none=True)
+        self.pending_steps = 0
+
     def _make_val_step_fn(self):
         # Builds function that performs a step in the validation loop
         def perform_val_step_fn(x, y):
-            # Sets model to EVAL mode
-            self.model.eval()
-
+            # No autocast here: the validation loss is the reported metric,
+            # so it is computed in float32 to avoid float16 rounding bias
             # Step 1 - Computes our model's predicted output - forward pass
             yhat = self.model(x)
             # Step 2 - Computes the loss
             loss = self.loss_fn(yhat, y)
             # There is no need to compute Steps 3 and 4, since we don't update parameters during evaluation
-            return loss.item()
+            return loss
 
         return perform_val_step_fn
-            
+
+    def _batches(self, data_loader, validation=False):
+        # Yields mini-batches that are already on the device
+        if isinstance(data_loader, tuple):
+            # Preloaded tensors live on the device already, so each
+            # mini-batch is just a slice of them - no DataLoader, no copies
+            # (to() is a no-op unless the trainer was moved to another
+            # device after the data was preloaded)
+            x_data, y_data = data_loader
+            x_data = x_data.to(self.device)
+            y_data = y_data.to(self.device)
+            n = len(x_data)
+            if validation:
+                for i in range(0, n, self.batch_size):
+                    yield x_data[i:i + self.batch_size], y_data[i:i + self.batch_size]
+            else:
+                # Shuffles the indices on the device itself
+                perm = torch.randperm(n, device=x_data.device)
+                for i in range(0, n, self.batch_size):
+                    idx = perm[i:i + self.batch_size]
+                    yield x_data[idx], y_data[idx]
+        elif self.copy_stream is not None:
+            # The next mini-batch is copied on a side stream while the
+            # model is still busy with the current one
+            loader_iter = iter(data_loader)
+            next_batch = self._prefetch(loader_iter)
+            while next_batch is not None:
+                current_stream = torch.cuda.current_stream(self.device)
+                current_stream.wait_stream(self.copy_stream)
+                x_batch, y_batch = next_batch
+                # Tells the caching allocator these tensors are also used
+                # by the current stream, so their memory isn't reused early
+                x_batch.record_stream(current_stream)
+                y_batch.record_stream(current_stream)
+                next_batch = self._prefetch(loader_iter)
+                yield x_batch, y_batch
+        else:
+            for x_batch, y_batch in data_loader:
+                x_batch = x_batch.to(self.device)
+                y_batch = y_batch.to(self.device)
+                yield x_batch, y_batch
+
+    def _prefetch(self, loader_iter):
+        # Fetches the next mini-batch and starts copying it to the GPU
+        # on the side stream - copies from pinned memory are asynchronous
+        try:
+            x_batch, y_batch = next(loader_iter)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.copy_stream):
+            x_batch = x_batch.to(self.device, non_blocking=True)
+            y_batch = y_batch.to(self.device, non_blocking=True)
+        return x_batch, y_batch
+
     def _mini_batch(self, validation=False):
         # The mini-batch can be used with both loaders
         # The argument `validation`defines which loader and 
@@ -119,59 +242,106 @@ class StepByStep(object):
 
         if data_loader is None:
             return None
+
+        # Sets model to TRAIN mode (or EVAL mode, in validation) once
+        # for the whole loop instead of at every mini-batch
+        self.model.train(mode=not validation)
             
         # Once the data loader and step function, this is the same
         # mini-batch loop we had before
-        mini_batch_losses = []
-        for x_batch, y_batch in data_loader:
-            x_batch = x_batch.to(self.device)
-            y_batch = y_batch.to(self.device)
-
+        # Losses are accumulated on the device, weighted by the size
+        # of each mini-batch, and only fetched once at the end
+        total_loss = torch.zeros((), device=self.device)
+        n_samples = 0
+        for x_batch, y_batch in self._batches(data_loader, validation):
             mini_batch_loss = step_fn(x_batch, y_batch)
-            mini_batch_losses.append(mini_batch_loss)
-
-        loss = np.mean(mini_batch_losses)
+            total_loss += mini_batch_loss.detach() * x_batch.size(0)
+            n_samples += x_batch.size(0)
+
+        # Gradients left over from an incomplete accumulation are
+        # used at the end of the epoch
+        if not validation and self.pending_steps > 0:
+            if self.pending_steps < self.accumulation_steps:
+                # Each micro-batch loss was divided by accumulation_steps,
+                # so the leftover gradients are rescaled to the average over
+                # the micro-batches actually accumulated (unscaling them
+                # first, since the scaler may have multiplied them)
+                self.scaler.unscale_(self.optimizer)
+                factor = self.accumulation_steps / self.pending_steps
+                for group in self.optimizer.param_groups:
+                    for param in group['params']:
+                        if param.grad is not None:
+                            param.grad.mul_(factor)
+            self._optimizer_step()
+
+        loss = (total_loss / n_samples).item()
         return loss
 
     def set_seed(self, seed=42):
-        torch.backends.cudnn.deterministic = True
-        torch.backends.cudnn.benchmark = False    
+        # Seeds the random number generators only - making cuDNN
+        # deterministic is a separate, process-wide choice
         torch.manual_seed(seed)
         np.random.seed(seed)
-    
+
+    def set_deterministic(self, enabled=True):
+        # Deterministic cuDNN algorithms make results reproducible at
+        # the cost of speed; otherwise, cuDNN's auto-tuner picks the
+        # fastest algorithms for the model (benchmark mode)
+        torch.backends.cudnn.deterministic = enabled
+        torch.backends.cudnn.benchmark = not enabled
+
     def train(self, n_epochs, seed=42):
         # To ensure reproducibility of the training process
-        self.set_seed(seed)
-
-        for epoch in range(n_epochs):
-            # Keeps track of the numbers of epochs
-            # by updating the corresponding attribute
-            self.total_epochs += 1
-
-            # inner loop
-            # Performs training using mini-batches
-            loss = self._mini_batch(validation=False)
-            self.losses.append(loss)
-
-            # VALIDATION
-            # no gradients in validation!
-            with torch.no_grad():
-                # Performs evaluation using mini-batches
-                val_loss = self._mini_batch(validation=True)
-                self.val_losses.append(val_loss)
-
-            # If a SummaryWriter has been set...
-            if self.writer:
-                scalars = {'training': loss}
-                if val_loss is not None:
-                    scalars.update({'validation': val_loss})
-                # Records both losses for each epoch under the main tag "loss"
-                self.writer.add_scalars(main_tag='loss',
-                                        tag_scalar_dict=scalars,
-                                        global_step=epoch)
+        # Pass seed=None to skip reseeding (e.g., if set_seed() was
+        # already called, or to continue an unseeded run)
+        if seed is not None:
+            self.set_seed(seed)
+
+        # Reserves room for this run's losses upfront
+        # (validation losses are NaN if there is no val_loader)
+        losses = np.empty(n_epochs, dtype=np.float32)
+        val_losses = np.empty(n_epochs, dtype=np.float32)
+        n_done = 0
+
+        try:
+            for epoch in range(n_epochs):
+                # inner loop
+                # Performs training using mini-batches
+                loss = self._mini_batch(validation=False)
+                losses[epoch] = loss
+
+                # VALIDATION
+                # no gradients in validation!
+                # inference mode also skips view and version tracking
+                with torch.inference_mode():
+                    # Performs evaluation using mini-batches
+                    val_loss = self._mini_batch(validation=True)
+                    val_losses[epoch] = np.nan if val_loss is None else val_loss
+
+                # Keeps track of the numbers of epochs
+                # by updating the corresponding attribute
+                # (only once the epoch's losses are recorded, so it
+                # always matches the length of the loss history)
+                self.total_epochs += 1
+                n_done += 1
+
+                # If a SummaryWriter has been set...
+                if self.writer:
+                    # Records both losses for each epoch under the "loss" section
+                    # add_scalar() writes to the run's own event file, while
+                    # add_scalars() opens an extra file writer for every tag
+                    self.writer.add_scalar('loss/training', loss, epoch)
+                    if val_loss is not None:
+                        self.writer.add_scalar('loss/validation', val_loss, epoch)
+        finally:
+            # Appends the losses of the completed epochs to the history
+            # of previous runs, even if training was interrupted
+            self.losses = np.concatenate([self.losses, losses[:n_done]])
+            self.val_losses = np.concatenate([self.val_losses, val_losses[:n_done]])
 
         if self.writer:
-            # Closes the writer
+            # Flushes all pending events once and closes the writer
+            self.writer.flush()
             self.writer.close()
 
     def save_checkpoint(self, filename):
@@ -179,6 +349,7 @@ class StepByStep(object):
         checkpoint = {'epoch': self.total_epochs,
                       'model_state_dict': self.model.state_dict(),
                       'optimizer_state_dict': self.optimizer.state_dict(),
+                      'scaler_state_dict': self.scaler.state_dict(),
                       'loss': self.losses,
                       'val_loss': self.val_losses}
 
@@ -191,22 +362,44 @@ class StepByStep(object):
         # Restore state for model and optimizer
         self.model.load_state_dict(checkpoint['model_state_dict'])
         self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        # Older checkpoints were saved before mixed precision was used, and
+        # a disabled scaler (e.g., on CPU) saves an empty state
+        if checkpoint.get('scaler_state_dict'):
+            self.scaler.load_state_dict(checkpoint['scaler_state_dict'])
 
         self.total_epochs = checkpoint['epoch']
-        self.losses = checkpoint['loss']
-        self.val_losses = checkpoint['val_loss']
+        # Older checkpoints store the losses as lists (None becomes NaN)
+        self.losses = np.asarray(checkpoint['loss'], dtype=np.float32)
+        self.val_losses = np.asarray(checkpoint['val_loss'], dtype=np.float32)
 
         self.model.train() # always use TRAIN for resuming training   
 
-    def predict(self, x):
+    def predict(self, x, return_tensor=False, batch_size=1024):
+        # If return_tensor is True, the predictions are returned as a
+        # tensor on the device - it is created in inference mode, so it
+        # cannot be used in autograd later (clone it outside inference
+        # mode for that)
         # Set is to evaluation mode for predictions
-        self.model.eval() 
-        # Takes aNumpy input and make it a float tensor
-        x_tensor = torch.as_tensor(x).float()
-        # Send input to device and uses model for prediction
-        y_hat_tensor = self.model(x_tensor.to(self.device))
-        # Set it back to train mode
-        self.model.train()
+        # There is no need to set it back to train mode afterwards, since
+        # every mini-batch loop sets the mode it needs before starting
+        self.model.eval()
+        # Takes a Numpy input and makes it a float tensor
+        x_tensor = torch.as_tensor(x, dtype=torch.float32)
+        # Sends input to device chunk by chunk and uses model for
+        # prediction, so large inputs don't run out of memory
+        with torch.inference_mode():
+            if len(x_tensor) == 0:
+                # There are no chunks to concatenate, so an empty input
+                # goes through the model in a single call
+                y_hat_tensor = self.model(x_tensor.to(self.device))
+            else:
+                y_hat_tensor = torch.cat([
+                    self.model(x_tensor[i:i + batch_size].to(self.device))
+                    for i in range(0, len(x_tensor), batch_size)
+                ])
+        # Callers that stay in PyTorch can keep the predictions on the device
+        if return_tensor:
+            return y_hat_tensor
         # Detaches it, brings it to CPU and back to Numpy
         return y_hat_tensor.detach().cpu().numpy()
 
@@ -224,7 +417,10 @@ class StepByStep(object):
     def add_graph(self):
         # Fetches a single mini-batch so we can use add_graph
         if self.train_loader and self.writer:
-            x_sample, y_sample = next(iter(self.train_loader))
+            if isinstance(self.train_loader, tuple):
+                x_sample = self.train_loader[0][:self.batch_size]
+            else:
+                x_sample, y_sample = next(iter(self.train_loader))
             self.writer.add_graph(self.model, x_sample.to(self.device))
 
 
@@ -240,73 +436,181 @@ def generate_data_linear(true_b=1, true_w=2, N=100, r_seed=42):
         r_seed (int): Random seed for reproducibility.
 
     Returns:
-        tuple: Two numpy arrays, x (input features) and y (target values).
+        tuple: Two float32 numpy arrays, x (input features) and y (target values).
     """
 
     # Generates random data for linear regression
-
-    np.random.seed(r_seed)
-    x = np.random.rand(N, 1)
-    y = true_b + true_w * x + (.1 * np.random.randn(N, 1))
+    # Uses a local generator instead of seeding NumPy's global state
+    rng = np.random.default_rng(r_seed)
+    x = rng.random((N, 1), dtype=np.float32)
+    noise = rng.standard_normal((N, 1), dtype=np.float32)
+
+    # Computes y = b + w * x + .1 * noise in place, without temporaries
+    y = np.empty_like(x)
+    np.multiply(x, true_w, out=y)
+    y += true_b
+    noise *= .1
+    y += noise
 
     # Returns the data as numpy arrays
     return x, y
 
 
-def prepare_data(x, y):
+def prepare_data(x, y, device=None, num_workers=2, batch_size=256):
     """ 
     Prepares data for training and validation by creating DataLoader objects.
     Args:
         x (numpy.ndarray): Input features.
         y (numpy.ndarray): Target values.
+        device (torch.device or str, optional): If given, the whole dataset is preloaded
+            to this device once and returned as tensors instead of loaders.
+        num_workers (int): Number of worker processes used by each
+            DataLoader. Ignored if the data is preloaded to a device.
+        batch_size (int): Mini-batch size used by each DataLoader. Larger
+            batches mean fewer kernel launches per epoch.
     Returns:
-        tuple: DataLoader objects for training and validation sets.
+        tuple: DataLoader objects for training and validation sets, or
+            (x, y) tuples of tensors on `device` if one was given.
     """
 
     torch.manual_seed(13)
 
     # Builds tensors from numpy arrays BEFORE split
-    x_tensor = torch.from_numpy(x).float()
-    y_tensor = torch.from_numpy(y).float()
-
-    # Builds dataset containing ALL data points
-    dataset = TensorDataset(x_tensor, y_tensor)
-
-    # Performs the split
+    # from_numpy() shares memory with float32 arrays, so we only
+    # make a float copy if the arrays are of a different type
+    x_tensor = torch.from_numpy(x)
+    if x_tensor.dtype != torch.float32:
+        x_tensor = x_tensor.float()
+    y_tensor = torch.from_numpy(y)
+    if y_tensor.dtype != torch.float32:
+        y_tensor = y_tensor.float()
+
+    # Performs the split using a permutation of the indices
+    # (the same permutation random_split would draw), so each
+    # set is a single tensor instead of a Subset of the dataset
     ratio = .8
-    n_total = len(dataset)
+    n_total = len(x_tensor)
     n_train = int(n_total * ratio)
-    n_val = n_total - n_train
+    perm = torch.randperm(n_total)
+    train_idx, val_idx = perm[:n_train], perm[n_train:]
+
+    x_train, y_train = x_tensor[train_idx], y_tensor[train_idx]
+    x_val, y_val = x_tensor[val_idx], y_tensor[val_idx]
+
+    if device is not None:
+        # Small datasets fit entirely in the device's memory, so we send
+        # them over once and skip the DataLoader machinery altogether
+        train_data = (x_train.to(device), y_train.to(device))
+        val_data = (x_val.to(device), y_val.to(device))
+        return train_data, val_data
 
-    train_data, val_data = random_split(dataset, [n_train, n_val])
+    # Builds a dataset of each set
+    train_data = TensorDataset(x_train, y_train)
+    val_data = TensorDataset(x_val, y_val)
 
     # Builds a loader of each set
+    # The samplers yield a whole list of indices at a time, so each
+    # mini-batch is fetched by indexing the tensors once, instead of
+    # fetching (and then stacking) one data point at a time
+    train_sampler = BatchSampler(RandomSampler(train_data),
+                                 batch_size=batch_size, drop_last=False)
+    val_sampler = BatchSampler(SequentialSampler(val_data),
+                               batch_size=batch_size, drop_last=False)
+    # Pinned (page-locked) batches allow for asynchronous copies to the GPU
+    pin_memory = torch.cuda.is_available()
+    # Workers assemble batches in the background and are kept alive
+    # across epochs - one or two are plenty for such a small dataset
+    worker_kwargs = {}
+    if num_workers > 0:
+        worker_kwargs = {'persistent_workers': True, 'prefetch_factor': 2}
+    # batch_size=None disables automatic batching - the batches
+    # come straight from the samplers
     train_loader = DataLoader(
         dataset=train_data,
-        batch_size=16,
-        shuffle=True
+        batch_size=None,
+        sampler=train_sampler,
+        pin_memory=pin_memory,
+        num_workers=num_workers,
+        **worker_kwargs
     )
     val_loader = DataLoader(
         dataset=val_data,
-        batch_size=16
+        batch_size=None,
+        sampler=val_sampler,
+        pin_memory=pin_memory,
+        num_workers=num_workers,
+        **worker_kwargs
     )
 
     return train_loader, val_loader
 
 
+def optimize_model(model, loss_fn):
+    """
+    Compiles the model and the loss function to cut down on Python
+    dispatch and kernel launch overhead in the training loop.
+    Uses torch.compile where TorchDynamo is supported, falling back to
+    TorchScript everywhere else.
+
+    Note: the fallback only covers Python versions and platforms that
+    TorchDynamo does not support. torch.compile compiles lazily, so if
+    TorchDynamo is supported but the backend fails (e.g., no C++ compiler
+    or an unsupported GPU), the error is only raised on the first
+    training step and there is no fallback - call `main()` without
+    `compile_model` in that case.
+    Args:
+        model (torch.nn.Module): Model to be optimized.
+        loss_fn (torch.nn.Module): Loss function to be optimized.
+    Returns:
+        tuple: The optimized model and loss function. Their parameters
+            are the same as the original ones, so an optimizer built
+            for the original model keeps working.
+    """
+
+    # Only imported here, as it is heavy and only needed for compiling
+    import torch._dynamo
+
+    if torch._dynamo.is_dynamo_supported():
+        # The graph is static, so the whole forward pass fits in a single
+        # graph. The default mode is used on purpose: 'reduce-overhead'
+        # captures CUDA graphs, which reuse their output buffers from one
+        # call to the next. Module.compile() compiles in place, so the
+        # state_dict keys are unchanged
+        model.compile(fullgraph=True)
+        loss_fn.compile(fullgraph=True)
+    else:
+        # TorchScript runs the forward pass and the loss in its own
+        # interpreter, without going back to Python between operations
+        model = torch.jit.script(model)
+        loss_fn = torch.jit.script(loss_fn)
+
+    return model, loss_fn
+
+
 # Prepare and train a simple linear regression model using the StepByStep class
-def main():
+def main(compile_model=False):
     """
     Main function to prepare data, define model, and train it using StepByStep class.
     It generates synthetic data for linear regression, prepares DataLoaders,
     defines a simple linear model, and trains it while logging losses to TensorBoard.
+
+    Args:
+        compile_model (bool): If True, compiles the model and the loss
+            function before training (see `optimize_model`). For a model
+            this small, compiling usually takes longer than training, and
+            it requires a C++ toolchain on CPU, so it is off by default.
     """
 
     # Generate data
     x, y = generate_data_linear(true_b=20, true_w=100, N=1000, r_seed=42)
 
-    # Prepare data
-    train_loader, val_loader = prepare_data(x, y)
+    # Prepare data - the whole dataset fits in memory, so it is
+    # preloaded to the device once
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    # Larger mini-batches amortize the launch cost of each step
+    batch_size = 256
+    train_loader, val_loader = prepare_data(x, y, device=device,
+                                            batch_size=batch_size)
 
     # Define model, loss function and optimizer
     lr = 0.1
@@ -318,7 +622,8 @@ def main():
     trainer = StepByStep(model=model, loss_fn=loss_fn, optimizer=optimizer)
 
     # Set loaders
-    trainer.set_loaders(train_loader=train_loader, val_loader=val_loader)
+    trainer.set_loaders(train_loader=train_loader, val_loader=val_loader,
+                        batch_size=batch_size)
 
     # Set TensorBoard writer
     folder = 'runs'
@@ -329,8 +634,14 @@ def main():
     # Add graph to TensorBoard
     trainer.add_graph()
 
-    # Train the model
-    trainer.train(n_epochs=200, seed=42)
+    # Optionally optimize the model and the loss function
+    # (after tracing the graph above)
+    if compile_model:
+        trainer.model, trainer.loss_fn = optimize_model(model, loss_fn)
+
+    # Seed once and train the model (no need to reseed in train)
+    trainer.set_seed(42)
+    trainer.train(n_epochs=200, seed=None)
 
     # Save the model checkpoint
     trainer.save_checkpoint(f'{folder}/linear_regression_checkpoint_{suffix}.pth')